@@ -1,5 +1,7 @@
 # standard library
 import sys
+import math
+import subprocess
 from argparse import Namespace, ArgumentParser
 from sys import stderr
 import os
@@ -7,6 +9,7 @@ import shutil
 # from pprint import pprint
 from time import sleep
 from multiprocessing import cpu_count
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from typing import Iterable
 from enum import Enum
 
@@ -15,17 +18,27 @@ import pyperclip as pc
 import validators
 from pytube import YouTube, Stream, StreamQuery, Playlist
 from pytube.exceptions import MembersOnly, AgeRestrictedError, RegexMatchError
-from moviepy.editor import AudioFileClip, VideoFileClip
 from tqdm import tqdm
 import requests
+from requests.adapters import HTTPAdapter
 
 # pip only
 import eyed3
 import eyed3.id3.frames
 
+# optional: yt-dlp fetches DASH fragments over many connections at once
+try:
+	import yt_dlp
+except ImportError:
+	yt_dlp = None
+
 class InvalidFormatException(Exception):
 	pass
 
+# shared session so thumbnails and range requests reuse TLS connections
+_HTTP = requests.Session()
+_HTTP.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=32))
+
 class Format(Enum):
 	Audio = 'audio'
 	Video = 'video'
@@ -33,15 +46,14 @@ class Format(Enum):
 
 	@staticmethod
 	def to_format(s: str):
-		d = dict()
-		for format in Format:
-			d[format.name.lower()] = format
-		
-		if s in d:
-			return d[s]
+		if s in _FORMAT_LOOKUP:
+			return _FORMAT_LOOKUP[s]
 		else:
 			raise InvalidFormatException(f'Invalid format: {s}\nAvailable types: {list(map(lambda x: x.name, Format))}')
 
+# built once instead of per to_format call
+_FORMAT_LOOKUP = {format.name.lower(): format for format in Format}
+
 def get_args() -> Namespace:
 	parser = ArgumentParser()
 
@@ -97,63 +109,138 @@ def get_args() -> Namespace:
 def get_metadata(yt: YouTube) -> dict:
 	return yt.metadata.metadata[0] if len(yt.metadata.metadata) > 0 else dict()
 
-def download_video_part(streams: StreamQuery, max_resolution: int, verbose: bool) -> str:
-	max_suitable_resolution = max(
-		filter(
-			lambda res: res <= max_resolution,
-			map(
-				lambda s: int(s.resolution.strip('p')),
-				streams
-			)
-		)
-	)
-
-	#pprint(streams)
-
-	best_video_streams: list[Stream] = list(
-		filter(
-			lambda s: int(s.resolution.strip('p')) <= max_suitable_resolution,
-			streams
-		)
-	)
-
-	# print('Best video streams:')
-	# pprint(best_video_streams)
-
-	best_video_stream: Stream = best_video_streams[-1]
+def ytdlp_download(yt: YouTube, stream: Stream, filename: str, verbose: bool) -> str:
+	'''
+	Download a specific stream through yt-dlp's multi-connection fragment
+	downloader. Returns the output path, or None when yt-dlp is not
+	installed or fails, in which case callers fall back to parallel_download.
+	'''
+	if yt_dlp is None:
+		return None
+
+	options = {
+		'format': str(stream.itag),
+		'outtmpl': filename.replace('%', '%%'), # outtmpl is a template string
+		'concurrent_fragment_downloads': 8,
+		'quiet': not verbose,
+		'noprogress': not verbose,
+	}
+	try:
+		with yt_dlp.YoutubeDL(options) as downloader:
+			downloader.download([yt.watch_url])
+	except yt_dlp.utils.DownloadError:
+		return None
+
+	return os.path.join(os.getcwd(), filename)
+
+def parallel_download(stream: Stream, filename: str = None, connections: int = 4) -> str:
+	'''
+	Download a stream over several parallel HTTP range requests, each worker
+	writing its slice into a preallocated file. Falls back to pytube's serial
+	download when the CDN does not honor ranges.
+	'''
+	if filename is None:
+		filename = stream.default_filename
+
+	try:
+		head = _HTTP.head(stream.url, allow_redirects=True, timeout=10)
+		total_size = int(head.headers.get('Content-Length', 0))
+	except requests.RequestException:
+		total_size = 0
+
+	if total_size == 0:
+		return stream.download(filename=filename)
+
+	# preallocate so each worker can seek to its own offset
+	with open(filename, 'wb') as out_file:
+		out_file.truncate(total_size)
+
+	def fetch_range(lo: int, hi: int):
+		resp = _HTTP.get(stream.url, headers={'Range': f'bytes={lo}-{hi}'}, stream=True, timeout=60)
+		if resp.status_code != 206: # server ignored the range header
+			raise IOError(f'Range request not supported (status {resp.status_code})')
+		with open(filename, 'r+b') as part_file:
+			part_file.seek(lo)
+			for data in resp.iter_content(chunk_size=64 * 1024):
+				part_file.write(data)
+
+	chunk_size = math.ceil(total_size / connections)
+	try:
+		with ThreadPoolExecutor(max_workers=connections) as executor:
+			futures = [
+				executor.submit(fetch_range, lo, min(lo + chunk_size, total_size) - 1)
+				for lo in range(0, total_size, chunk_size)
+			]
+			for future in as_completed(futures):
+				future.result()
+	except (requests.RequestException, IOError):
+		os.remove(filename)
+		return stream.download(filename=filename)
+
+	return os.path.join(os.getcwd(), filename)
+
+def download_video_part(yt: YouTube, streams: StreamQuery, max_resolution: int, verbose: bool) -> str:
+	# resolve the resolution of every stream once instead of re-parsing it
+	# in a second pass
+	resolved = [ (int(s.resolution.rstrip('p')), s) for s in streams if s.resolution ]
+	eligible = [ pair for pair in resolved if pair[0] <= max_resolution ]
+	if len(eligible) == 0:
+		raise ValueError(f'No video stream with resolution <= {max_resolution}p available')
+
+	best_video_stream: Stream = max(eligible, key=lambda pair: pair[0])[1]
 	if verbose:
 		print(f'Downloading video part in resolution {best_video_stream.resolution} in {best_video_stream.fps} fps ...')
-	res = best_video_stream.download()
+	res = ytdlp_download(yt, best_video_stream, best_video_stream.default_filename, verbose)
+	if res is None:
+		res = parallel_download(best_video_stream)
 	return res
 
-def download_audio_part(streams: StreamQuery, verbose: bool) -> str:
-	
+def download_audio_part(yt: YouTube, streams: StreamQuery, verbose: bool) -> str:
+
 	stream: Stream = streams.order_by('abr').desc().first()
 
 	if verbose:
 		print('Downloading audio part...')
-	res = stream.download()
+	res = ytdlp_download(yt, stream, stream.default_filename, verbose)
+	if res is None:
+		res = parallel_download(stream)
 	return res
 
+_COMPRESSION_PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast',
+	'medium', 'slow', 'slower', 'veryslow', 'placebo')
+
 def get_compression_preset(compression_level: int) -> str:
-	presets = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast',
-		'medium', 'slow', 'slower', 'veryslow', 'placebo']
-	return presets[compression_level]
+	return _COMPRESSION_PRESETS[compression_level]
+
+# built once; translate runs as a single C loop per call
+_FORBIDDEN_TABLE = str.maketrans({symbol: '_' for symbol in '/\\?%*:|"<>'}) if sys.platform == 'win32' else None
 
 def remove_forbidden(s: str) -> str:
-	forbidden_symbols = list()
-	if sys.platform == 'win32':
-		forbidden_symbols = ['/', '\\', '?', '%', '*', ':', '|', '"', '<', '>']
-	
-	for symbol in forbidden_symbols:
-		s = s.replace(symbol, '_')
-	
-	s = ''.join(map(lambda symbol: symbol if ord(symbol) <= 127 else '_', s))
-	
+	if _FORBIDDEN_TABLE is not None:
+		s = s.translate(_FORBIDDEN_TABLE)
+
+	if not s.isascii():
+		s = s.encode('ascii', 'replace').decode('ascii').replace('?', '_')
+
 	return s
 
-def on_progress_callback(_, chunk: bytes, bytes_remaining: int, progress_bar: tqdm):
-	progress_bar.update(len(chunk))
+def make_progress_callback(progress_bar: tqdm, threshold: int = 256 * 1024):
+	'''
+	Build a pytube on_progress callback that batches tqdm updates, so the
+	bar lock is only taken every ~256 KB instead of on every chunk.
+	'''
+	accumulated = [0]
+
+	def on_progress_callback(_, chunk: bytes, bytes_remaining: int):
+		accumulated[0] += len(chunk)
+		if accumulated[0] >= threshold or bytes_remaining == 0:
+			progress_bar.update(accumulated[0])
+			accumulated[0] = 0
+
+	return on_progress_callback
+
+# small pool for thumbnail fetches so they overlap with the mp3 encode
+_THUMB_POOL = ThreadPoolExecutor(max_workers=4)
 
 def download_audio(args: Namespace, yt: YouTube, all_streams, prefix: str = "", verbose: bool = True):
 	'''
@@ -166,25 +253,45 @@ def download_audio(args: Namespace, yt: YouTube, all_streams, prefix: str = "",
 	if verbose:
 		print(f'Downloading audio for {yt.title} in {stream.abr}')
 	#out_base = yt.title.replace(" ","_")
+	wants_metadata = (args.add_metadata or args.artist
+		or args.title or args.album)
+	# ID3 tags need an mp3 container; without them an m4a source can be
+	# kept as-is and the whole re-encode skipped
+	keep_original = not wants_metadata and stream.subtype in ('mp4', 'm4a')
+
 	out_base = remove_forbidden(yt.title)
 	out_ext = stream.mime_type.split("/")[1]
 	out_filename = f'{out_base}.{out_ext}'
-	out_final = f'{prefix}{"-" if len(prefix) > 0 else ""}{out_base}.mp3'
-	#out_filename = remove_forbidden(out_filename) 
-	if out_final not in os.listdir():
-		stream.download(filename=out_filename)
-		
-		# fix file metadata
-		with AudioFileClip(out_filename) as audio_clip:
-			loggerType = 'bar' if verbose else None
-			# remove "bps" from "160kbps" for ffmpeg
-			bitrate = None # '256k' # f'{stream.abr[:-3]}'
-			audio_clip.write_audiofile(out_final, nbytes=4, bitrate=bitrate, logger=loggerType)
-			#audio_clip.write_audiofile(out_final, logger=None)
-		os.remove(out_filename)
+	out_final_ext = 'm4a' if keep_original else 'mp3'
+	out_final = f'{prefix}{"-" if len(prefix) > 0 else ""}{out_base}.{out_final_ext}'
+	#out_filename = remove_forbidden(out_filename)
 
-	if (args.add_metadata or args.artist 
-		or args.title or args.album):
+	thumb_future = None
+	if wants_metadata:
+		# fire the thumbnail request now so it overlaps the download/encode
+		thumb_future = _THUMB_POOL.submit(_HTTP.get, yt.thumbnail_url, timeout=10)
+
+	if not os.path.exists(out_final):
+		if ytdlp_download(yt, stream, out_filename, verbose) is None:
+			parallel_download(stream, out_filename)
+
+		if keep_original:
+			os.rename(out_filename, out_final)
+		else:
+			if verbose:
+				print(f'Converting {out_filename} to mp3...')
+			# one-shot ffmpeg transcode instead of decoding through moviepy's
+			# python frame pipeline
+			bitrate = None # '256k' # f'{stream.abr[:-3]}'
+			ffmpeg_cmd = ['ffmpeg', '-y', '-i', out_filename, '-vn', '-c:a', 'libmp3lame', '-q:a', '2',
+				'-threads', str(args.threads)]
+			if bitrate is not None:
+				ffmpeg_cmd += ['-b:a', bitrate]
+			ffmpeg_cmd.append(out_final)
+			subprocess.run(ffmpeg_cmd, check=True, capture_output=not verbose)
+			os.remove(out_filename)
+
+	if wants_metadata:
 		yt_metadata = get_metadata(yt)
 
 		if args.artist is not None:
@@ -225,8 +332,11 @@ def download_audio(args: Namespace, yt: YouTube, all_streams, prefix: str = "",
 
 		if verbose:
 			print('Downloading thumbnail...')
-		resp = requests.get(yt.thumbnail_url, stream=True)
-		if resp.status_code == 200:
+		try:
+			resp = thumb_future.result()
+		except requests.RequestException:
+			resp = None
+		if resp is not None and resp.status_code == 200:
 			#print(resp.headers)
 			#tag.images.set(eyed3.id3.frames.ImageFrame.FRONT_COVER, resp.content, 'image/jpeg')
 			cover_img = resp.content
@@ -256,23 +366,36 @@ def download_video(args: Namespace, yt: YouTube, all_streams: StreamQuery, verbo
 		os.mkdir(str(current_process_id))
 		os.chdir(str(current_process_id))
 		try:
-			audio_file_path = download_audio_part(all_streams.filter(type='audio'), verbose)
-			video_file_path = download_video_part(all_streams.filter(type='video', subtype='mp4').order_by('resolution'), args.max_resolution, verbose)
+			# audio and video are independent streams -> download them concurrently
+			with ThreadPoolExecutor(max_workers=2) as executor:
+				audio_future = executor.submit(download_audio_part,
+					yt, all_streams.filter(type='audio'), verbose)
+				video_future = executor.submit(download_video_part,
+					yt, all_streams.filter(type='video', subtype='mp4').order_by('resolution'), args.max_resolution, verbose)
+				audio_file_path = audio_future.result()
+				video_file_path = video_future.result()
 
 			title = remove_forbidden(yt.title)
 			final_video_filename = f'{title}.mp4'
 			if verbose:
 				print('Merging video and audio...')
-			with VideoFileClip(video_file_path) as video_clip:
-				with AudioFileClip(audio_file_path) as audio_clip:
-					with video_clip.set_audio(audio_clip) as final_clip:
-						final_clip: VideoFileClip
-						compression_preset = get_compression_preset(args.compress_level)
-						final_clip.write_videofile(final_video_filename, 
-							#codec="h264_nvenc",
-							threads=args.threads, preset=compression_preset, logger='bar' if verbose else None)
-
-			
+			# the downloaded video part is already H.264, so muxing with a
+			# stream copy avoids re-encoding it entirely
+			try:
+				subprocess.run(['ffmpeg', '-y', '-i', video_file_path, '-i', audio_file_path,
+					'-c:v', 'copy', '-c:a', 'aac', '-b:a', '192k',
+					'-threads', str(args.threads), final_video_filename],
+					check=True, capture_output=not verbose)
+			except subprocess.CalledProcessError:
+				# stream copy can fail on codecs mp4 cannot carry -> re-encode
+				compression_preset = get_compression_preset(args.compress_level)
+				subprocess.run(['ffmpeg', '-y', '-i', video_file_path, '-i', audio_file_path,
+					#'-c:v', 'h264_nvenc',
+					'-c:v', 'libx264', '-preset', compression_preset, '-c:a', 'aac', '-b:a', '192k',
+					'-threads', str(args.threads), final_video_filename],
+					check=True, capture_output=not verbose)
+
+
 			shutil.move(final_video_filename, os.pardir)
 			if verbose:
 				print('Done.')
@@ -289,14 +412,15 @@ def download_video(args: Namespace, yt: YouTube, all_streams: StreamQuery, verbo
 	else:
 		best_stream: Stream = all_streams.filter(type='video', progressive=True, subtype='mp4').order_by('resolution').last()
 		filename = remove_forbidden(yt.title + '.' + best_stream.mime_type.split('/')[1])
-		if filename in os.listdir():
+		if os.path.exists(filename):
 			return
 		if verbose:
 			print(f'Downloading {yt.title}...', file=stderr)
-		best_stream.download(filename=filename)
+		if ytdlp_download(yt, best_stream, filename, verbose) is None:
+			best_stream.download(filename=filename)
 
-def get_urls(args: Namespace) -> list[YouTube]:
-	videos: list[YouTube]
+def get_urls(args: Namespace) -> list[str]:
+	urls: list[str]
 	if args.playlist is not None:
 		try:
 			playlist = Playlist(args.playlist)
@@ -317,56 +441,76 @@ def get_urls(args: Namespace) -> list[YouTube]:
 				os.mkdir(dir_name)
 				os.chdir(dir_name)
 
-			videos = list(playlist.videos)
+			# video_urls only pages through the playlist; unlike .videos it
+			# does not resolve metadata for every entry up front
+			urls = list(playlist.video_urls)
 		except:
 			print(f'Failed to download media from {args.playlist}', file=stderr)
 			exit(1)
 	if args.url:
 		try:
-			videos = [ YouTube(url) for url in args.url ]
+			urls = [ YouTube(url).watch_url for url in args.url ]
 		except:
 			print(f'Failed to download media from {args.url}', file=stderr)
 			exit(1)
-	return videos
+	return urls
 
-def progress_update(iterator: Iterable, yt: YouTube):
-	iterator.desc = f'{yt.title[:35]}'
-	iterator.refresh()
+def _safe_streams(yt: YouTube) -> StreamQuery:
+	'''
+	Resolve yt.streams (triggers the player-JS fetch and decipher),
+	returning None for videos pytube cannot handle.
+	'''
+	try:
+		return yt.streams
+	except MembersOnly: # video in the playlist is only for members of the channel
+		return None
+	except AgeRestrictedError:
+		return None
+	except RegexMatchError:
+		return None
+
+def _process_one(args: Namespace, index: int, url: str, verbose: bool):
+	'''
+	Per-video worker body. Kept top-level so it is pickleable and
+	reconstructs the YouTube object inside the worker process.
+	'''
+	yt = YouTube(url)
+
+	all_streams = _safe_streams(yt)
+	if all_streams is None:
+		return
+
+	if args.format in [Format.Video, Format.Both]:
+		download_video(args, yt, all_streams, verbose)
+	if args.format in [Format.Audio, Format.Both]:
+		prefix = "" if args.playlist is None else f"{index:03d}"
+		download_audio(
+			args,
+			yt,
+			all_streams,
+			prefix,
+			verbose)
 
 def main():
 	args = get_args()
 
-	videos: list[YouTube] = get_urls(args)
+	urls: list[str] = get_urls(args)
 
 	verbose_cond = args.playlist is None
 	verbose: bool = not args.silent and verbose_cond and not args.single_progress_bar
-	iterator: Iterable = tqdm(enumerate(videos), ascii=True, total=len(videos)) if not verbose_cond else enumerate(videos)
+	# each ffmpeg gets args.threads, so cap workers to avoid oversubscription
+	max_workers = max(1, cpu_count() // max(1, args.threads))
 	try:
-		for i, yt in iterator:
-			yt: YouTube
-			
+		with ProcessPoolExecutor(max_workers=max_workers) as executor:
+			futures = [
+				executor.submit(_process_one, args, i, url, verbose)
+				for i, url in enumerate(urls)
+			]
+			completed: Iterable = as_completed(futures)
 			if not verbose_cond:
-				progress_update(iterator, yt)
-
-			try:
-				all_streams = yt.streams
-			except MembersOnly: # video in the playlist is only for members of the channel
-				continue
-			except AgeRestrictedError:
-				continue
-			except RegexMatchError:
-				continue
-
-			if args.format in [Format.Video, Format.Both]:
-				download_video(args, yt, all_streams, verbose)
-			if args.format in [Format.Audio, Format.Both]:
-				prefix = "" if args.playlist is None else f"{i:03d}"
-				download_audio(
-					args,
-					yt,
-					all_streams,
-					prefix,
-					verbose)
+				completed = tqdm(completed, ascii=True, total=len(futures))
+			for future in completed:
+				future.result()
 		# if len(videos) > 1:
 		# 	for obj in os.listdir():
 		# 		if os.path.isdir(obj) and obj.startswith(f'{os.getpid()}'):
@@ -5,17 +5,21 @@ import main as lib
 from flask import Flask, redirect, request, session, send_file, Response, render_template
 from werkzeug.utils import secure_filename
 
-from moviepy.editor import VideoFileClip, ImageClip
+from moviepy.editor import VideoFileClip
 import numpy as np
 
 import zipfile
 import os
+from itertools import chain
 from datetime import datetime
 from tqdm import tqdm
 
 HOST = '0.0.0.0'
 PORT = 8000
 
+# already-compressed formats that deflate would only waste CPU on
+ALREADY_COMPRESSED_EXTS = ('.mp4', '.mkv', '.webm', '.mp3', '.m4a', '.jpg', '.png')
+
 app = Flask(__name__, static_url_path='/')
 
 app.secret_key = 'super_secret-key!'
@@ -69,20 +73,17 @@ def processing():
                 video_file = video_file.resize(video_file.size[::-1])
                 video_file.rotation = 0
 
-            tt = np.arange(0, video_file.duration, 1.0 / video_file.fps)
-            
-            image_clip: ImageClip = video_file.to_ImageClip(0)
-            img_arr = image_clip.get_frame(0)
+            total = int(math.floor(video_file.duration * video_file.fps))
+
+            # one sequential decode through a single ffmpeg pipe instead of
+            # re-seeking the reader for every frame
+            frame_iter = video_file.iter_frames(dtype='uint8')
+            first_frame = next(frame_iter)
             #result_img = eval(f'lib.{func}_start')(img_arr)
-            processing.start(img_arr)
-            #clips_amount = len(tt)
+            processing.start(first_frame)
 
             #step_func = eval(f'lib.{func}_step')
-            l = list(enumerate(tt))
-            total = len(l)
-            for i, t in l:
-                image_clip: ImageClip = video_file.to_ImageClip(t)
-                img_arr = image_clip.get_frame(0)
+            for i, img_arr in enumerate(chain((first_frame,), frame_iter)):
                 processing.step(img_arr)
                 #result_img = step_func(result_img, img_arr)
                 # send progress to client
@@ -92,9 +93,11 @@ def processing():
         processing.end()
 
         if stretch:
-            min_val, max_val = np.min(processing.res_photo), np.max(processing.res_photo)
+            arr = processing.res_photo
+            min_val, max_val = arr.min(), arr.max()
             #print(f'Min: {min_val}, Max: {max_val}')
-            processing.res_photo = ((processing.res_photo - min_val) * (255 / max_val)).astype(np.int64)
+            scale = np.float32(255.0 / (max_val - min_val if max_val > min_val else 1))
+            processing.res_photo = np.clip((arr - min_val) * scale, 0, 255).astype(np.uint8)
 
         result_img = processing.get_photo() #Image.fromarray( np.uint8(result_photo) )
         result_img_path = os.path.join(
@@ -125,22 +128,21 @@ if __name__ == '__main__':
     try:
         app.run(HOST, PORT, debug=True, threaded=True)
     finally:
-        for file in os.listdir('processed'):
-            os.remove(os.path.join(
-                'processed',
-                file
-            ))
-            
-        uploaded_files = os.listdir('uploads')
+        with os.scandir('processed') as entries:
+            for entry in entries:
+                if entry.is_file():
+                    os.unlink(entry.path)
+
+        with os.scandir('uploads') as entries:
+            uploaded_files = [entry for entry in entries if entry.is_file()]
         if len(uploaded_files) > 0:
             with zipfile.ZipFile(
                     f'uploads-{ math.floor(datetime.utcnow().timestamp())}.zip',
-                    'w', zipfile.ZIP_DEFLATED
+                    'w', zipfile.ZIP_STORED
                 ) as zipf:
-                for file in tqdm(uploaded_files, ascii=True):
-                    file_path = os.path.join(
-                        'uploads',
-                        file
-                    )
-                    zipf.write(file_path)
-                    os.remove(file_path)
\ No newline at end of file
+                for entry in tqdm(uploaded_files, ascii=True):
+                    compression = (zipfile.ZIP_STORED
+                        if os.path.splitext(entry.name)[1].lower() in ALREADY_COMPRESSED_EXTS
+                        else zipfile.ZIP_DEFLATED)
+                    zipf.write(entry.path, compress_type=compression)
+                    os.unlink(entry.path)
\ No newline at end of file